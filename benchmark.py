@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from synthetic import generate_dataset, replicate_resources
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def repo_version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                       cwd=REPO_DIR).strip().decode()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def count_reads(fn):
+    with open(fn) as fp:
+        return sum(1 for _ in fp) // 4
+
+
+def run_benchmark(cmd, cwd):
+    '''Run cmd in a child process and return its wall time in seconds
+    and peak resident memory in MB. wait4 gives us the rusage of this
+    child alone, so runs don't contaminate each other.
+    '''
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=devnull, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        # Drain stderr ourselves so the child can't block on a full
+        # pipe; it is only shown if the run fails.
+        err = proc.stderr.read()
+        _, status, rusage = os.wait4(proc.pid, 0)
+        elapsed = time.time() - start
+    if status != 0:
+        raise RuntimeError('{cmd} failed:\n{err}'.format(cmd=' '.join(cmd), err=err))
+    # ru_maxrss is in kilobytes on Linux.
+    return elapsed, rusage.ru_maxrss / 1024.0
+
+
+def build_benchmarks(paths, work_dir, graph_samples):
+    '''Return (name, cmd, n_items, unit) for each hot path, given the
+    paths of a generated synthetic dataset. The task graph is built for
+    graph_samples samples, enough that building it outweighs starting
+    the interpreter.
+    '''
+    python = sys.executable
+    reads_fn = paths['interleaved'][0]
+    n_reads = count_reads(reads_fn)
+    n_contigs = len(pd.read_csv(paths['stats'], delimiter='\t', usecols=['ID']))
+    graph_resources = replicate_resources(paths['resources'],
+                                          os.path.join(work_dir, 'graph-resources.json'),
+                                          graph_samples)
+
+    # Call the function behind format_abyss_task directly; a doit
+    # action can't execute outside the runner, and any exception here
+    # fails the child process and so the benchmark.
+    format_abyss = 'from tasks import format_abyss; format_abyss({i!r}, {o!r})'.format(
+                   i=reads_fn, o=os.path.join(work_dir, 'format_abyss.fq'))
+
+    return [('get-high-abund',
+             [python, os.path.join(REPO_DIR, 'get-high-abund.py'), '-k', '25', '-N', '4',
+              '-x', '1e7', '--min-abundance', '5', '-o', os.path.join(work_dir, 'high-abund.fa'),
+              reads_fn],
+             n_reads, 'reads'),
+            ('format_abyss_task',
+             [python, '-c', format_abyss],
+             n_reads, 'reads'),
+            ('plot_cov_hist',
+             [python, os.path.join(REPO_DIR, 'plot_cov_hist.py'), '-i', paths['hist'],
+              '-o', os.path.join(work_dir, 'cov_hist'), '--format', 'png'],
+             1, 'plots'),
+            ('plot_stats',
+             [python, os.path.join(REPO_DIR, 'plot_stats.py'), '-i', paths['stats'],
+              '-o', os.path.join(work_dir, 'stats'), '--format', 'png'],
+             n_contigs, 'contigs'),
+            ('pipeline_task_graph',
+             [python, os.path.join(REPO_DIR, 'pipeline'), '--resources', graph_resources,
+              '--config', os.path.join(REPO_DIR, 'test', 'config.json'),
+              '--data-dir', os.path.join(work_dir, '_data'),
+              '--work-dir', os.path.join(work_dir, '_work'), 'list'],
+             graph_samples, 'samples')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline\'s Python hot paths '
+                                     'on synthetic data and record throughput and peak memory.')
+    parser.add_argument('--work-dir', default='_bench')
+    parser.add_argument('--results', default='benchmarks.tsv',
+                        help='TSV that results are appended to, relative to --work-dir')
+    parser.add_argument('--only', nargs='+', help='Only run these benchmarks')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--n-pairs', type=int, default=100000)
+    parser.add_argument('--n-samples', type=int, default=2)
+    parser.add_argument('--graph-samples', type=int, default=1000,
+                        help='Samples in the task graph built by pipeline_task_graph')
+    parser.add_argument('--read-len', type=int, default=100)
+    parser.add_argument('--error-rate', type=float, default=0.005)
+    parser.add_argument('--error-profile', choices=['flat', 'ramp'], default='ramp')
+    parser.add_argument('--n-contigs', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    work_dir = os.path.abspath(args.work_dir)
+    print('** Generating synthetic data in {d}'.format(d=work_dir), file=sys.stderr)
+    paths = generate_dataset(os.path.join(work_dir, 'data'), args.n_pairs,
+                             n_samples=args.n_samples, read_len=args.read_len,
+                             error_rate=args.error_rate, error_profile=args.error_profile,
+                             n_contigs=args.n_contigs, seed=args.seed)
+
+    version = repo_version()
+    date = time.strftime('%Y-%m-%d-%H%M')
+    rows = []
+    for name, cmd, n_items, unit in build_benchmarks(paths, work_dir, args.graph_samples):
+        if args.only and name not in args.only:
+            continue
+        for repeat in range(args.repeats):
+            elapsed, max_rss = run_benchmark(cmd, REPO_DIR)
+            print('** {name} [{repeat}]: {elapsed:.2f}s, {rate:.1f} {unit}/s, '
+                  '{max_rss:.1f} MB'.format(rate=n_items / elapsed, **locals()), file=sys.stderr)
+            rows.append({'version': version, 'date': date, 'benchmark': name,
+                         'repeat': repeat, 'n': n_items, 'unit': unit, 'seconds': elapsed,
+                         'throughput': n_items / elapsed, 'max_rss_mb': max_rss})
+
+    results_fn = os.path.join(work_dir, args.results)
+    df = pd.DataFrame(rows, columns=['version', 'date', 'benchmark', 'repeat', 'n', 'unit',
+                                     'seconds', 'throughput', 'max_rss_mb'])
+    df.to_csv(results_fn, sep='\t', index=False, mode='a',
+              header=not os.path.exists(results_fn))
+
+    # Show every recorded version side by side so a regression is
+    # obvious at a glance.
+    history = pd.read_csv(results_fn, delimiter='\t')
+    summary = history.groupby(['benchmark', 'version']).agg({'throughput': 'median',
+                                                            'max_rss_mb': 'max'})
+    print(summary.to_string(), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
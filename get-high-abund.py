@@ -12,6 +12,8 @@ from khmer.khmer_args import (build_counting_args, add_threading_args,
                               sanitize_help)
 import screed
 
+from telemetry import Progress
+
 def iterkmers(seq, K):
 
     for i in xrange(len(seq) - K + 1):
@@ -28,15 +30,23 @@ def main():
     countgraph = khmer_args.create_countgraph(args, multiplier=1.1)
 
     count = 0
+    total = 0
+    progress = Progress('get-high-abund', args.input_files)
     for fn in args.input_files:
         short = os.path.basename(fn)
         for n, record in enumerate(screed.open(fn)):
             if n % 100000 == 0:
-                print('Processed {n} reads...'.format(n=n), file=sys.stderr)
+                print('Processed {n} reads ({p})...'.format(n=n, p=progress.summary()),
+                      file=sys.stderr)
+            if total % 1000 == 0:
+                progress.update(records=total)
+            total += 1
             countgraph.consume(record.sequence)
             if countgraph.median_at_least(record.sequence, args.min_abundance):
                 args.out.write('>{fn}:{name}:{c}\n{seq}\n'.format(fn=short, c=count, name=record.name, seq=record.sequence))
                 count += 1
+    progress.update(records=total)
+    progress.finish()
 
 if __name__ == '__main__':
     main()
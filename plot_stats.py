@@ -25,24 +25,47 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', '--stats-file')
     parser.add_argument('-o', '--output-prefix')
+    parser.add_argument('--coverage-file',
+                        help='Per-contig alignment coverage from postprocess')
     parser.add_argument('--format', nargs='+', default=['pdf'])
     args = parser.parse_args()
 
-    df = pd.read_csv(args.stats_file, delimiter='\t')
+    if not args.stats_file and not args.coverage_file:
+        parser.error('need a --stats-file and/or a --coverage-file')
     if not args.output_prefix:
+        if not args.stats_file:
+            parser.error('--output-prefix is required without a --stats-file')
         args.output_prefix = os.path.basename(os.path.dirname(args.stats_file).strip('/'))
 
-    with FigManager(show=False, save=args.output_prefix + '.cov', exts=args.format) as (fig, ax):
-        sns.distplot(df[df['short1_cov'] > 0]['short1_cov'], bins=50, kde=False)
-        ax.set_title('{t} k-mer Coverage Histogram'.format(t=args.output_prefix))
-        ax.set_ylabel('Count')
-        ax.set_xlabel('k-mer Abundance')
-
-    with FigManager(show=False, save=args.output_prefix + '.lgth', exts=args.format) as (fig, ax):
-        sns.distplot(df[df['lgth'] > 0]['lgth'], bins=50, kde=False)
-        ax.set_title('{t} k-mer Coverage Histogram'.format(t=args.output_prefix))
-        ax.set_ylabel('Count')
-        ax.set_xlabel('Length')
+    if args.stats_file:
+        df = pd.read_csv(args.stats_file, delimiter='\t')
+
+        with FigManager(show=False, save=args.output_prefix + '.cov', exts=args.format) as (fig, ax):
+            sns.distplot(df[df['short1_cov'] > 0]['short1_cov'], bins=50, kde=False)
+            ax.set_title('{t} k-mer Coverage Histogram'.format(t=args.output_prefix))
+            ax.set_ylabel('Count')
+            ax.set_xlabel('k-mer Abundance')
+
+        with FigManager(show=False, save=args.output_prefix + '.lgth', exts=args.format) as (fig, ax):
+            sns.distplot(df[df['lgth'] > 0]['lgth'], bins=50, kde=False)
+            ax.set_title('{t} k-mer Coverage Histogram'.format(t=args.output_prefix))
+            ax.set_ylabel('Count')
+            ax.set_xlabel('Length')
+
+    if args.coverage_file:
+        cov_df = pd.read_csv(args.coverage_file, delimiter='\t')
+        with FigManager(show=False, save=args.output_prefix + '.aln_cov', exts=args.format) as (fig, ax):
+            # Keep zero-coverage contigs; they are part of the picture.
+            sns.distplot(cov_df['mean_cov'], bins=50, kde=False)
+            ax.set_title('{t} Read Alignment Coverage Histogram'.format(t=args.output_prefix))
+            ax.set_ylabel('Count')
+            ax.set_xlabel('Mean Depth')
+
+        with FigManager(show=False, save=args.output_prefix + '.aln_cov_lgth', exts=args.format) as (fig, ax):
+            ax.scatter(cov_df['lgth'], cov_df['mean_cov'], alpha=0.3)
+            ax.set_title('{t} Contig Length vs. Coverage'.format(t=args.output_prefix))
+            ax.set_ylabel('Mean Depth')
+            ax.set_xlabel('Length')
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import argparse
+import gzip
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+BASES = np.array(list('ACGT'))
+
+
+def error_rates(read_len, error_rate, error_profile):
+    '''Per-position substitution probabilities. `flat` uses error_rate
+    everywhere; `ramp` rises linearly from error_rate to 3x error_rate
+    at the 3' end, roughly like Illumina.
+    '''
+    assert error_profile in ['flat', 'ramp']
+    if error_profile == 'flat':
+        return np.repeat(error_rate, read_len)
+    return np.linspace(error_rate, 3 * error_rate, read_len)
+
+
+def simulate_reads(fp, n_pairs, read_len=100, genome_len=100000, insert_size=350,
+                   error_rate=0.005, error_profile='ramp', seed=1, batch_size=10000,
+                   prefix='read'):
+    '''Write n_pairs of interleaved paired-end FASTQ records sampled
+    from a random genome, with substitution errors drawn from the
+    given error profile. Reads are generated in batches so memory use
+    does not grow with n_pairs.
+    '''
+    rng = np.random.RandomState(seed)
+    genome = rng.randint(0, 4, genome_len)
+    probs = error_rates(read_len, error_rate, error_profile)
+    quals = ''.join(chr(33 + int(q)) for q in np.clip(-10 * np.log10(probs), 2, 41))
+    offsets = np.arange(read_len)
+
+    for batch_start in range(0, n_pairs, batch_size):
+        n = min(batch_size, n_pairs - batch_start)
+        starts = rng.randint(0, genome_len - insert_size, n)
+        left = genome[starts[:, None] + offsets]
+        # The right mate comes off the reverse strand at the far end
+        # of the insert.
+        right = 3 - genome[(starts + insert_size - 1)[:, None] - offsets]
+        for reads in (left, right):
+            errors = rng.random_sample(reads.shape) < probs
+            reads[errors] = (reads[errors] + rng.randint(1, 4, errors.sum())) % 4
+        left, right = BASES[left], BASES[right]
+
+        for i in range(n):
+            name = '{prefix}{n}'.format(prefix=prefix, n=batch_start + i)
+            fp.write('@{name}/1\n{seq}\n+\n{qual}\n'.format(name=name,
+                     seq=''.join(left[i]), qual=quals))
+            fp.write('@{name}/2\n{seq}\n+\n{qual}\n'.format(name=name,
+                     seq=''.join(right[i]), qual=quals))
+
+
+def simulate_hist(max_abundance=500, coverage=30, n_kmers=1000000, seed=1):
+    '''An abundance-dist.py style histogram: a Poisson peak around
+    coverage on top of a spike of low-abundance error k-mers.
+    '''
+    rng = np.random.RandomState(seed)
+    true_kmers = rng.poisson(coverage, n_kmers)
+    error_kmers = rng.geometric(0.6, n_kmers // 2)
+    counts = np.bincount(np.concatenate([true_kmers, error_kmers]),
+                         minlength=max_abundance + 1)[:max_abundance + 1]
+    df = pd.DataFrame({'abundance': np.arange(max_abundance + 1), 'count': counts})
+    df['cumulative'] = df['count'].cumsum()
+    df['cumulative_fraction'] = df['cumulative'] / float(df['count'].sum())
+    return df[['abundance', 'count', 'cumulative', 'cumulative_fraction']]
+
+
+def simulate_velvet_stats(n_contigs=100000, seed=1):
+    '''A velvet stats.txt style table with log-normal contig lengths
+    and coverage.
+    '''
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame({'ID': np.arange(1, n_contigs + 1),
+                       'lgth': rng.lognormal(5, 1.2, n_contigs).astype(int),
+                       'out': rng.randint(0, 3, n_contigs),
+                       'in': rng.randint(0, 3, n_contigs),
+                       'long_cov': 0.0,
+                       'long_Obs': 0,
+                       'short1_cov': rng.lognormal(2.5, 0.5, n_contigs),
+                       'short2_cov': 0.0,
+                       'short2_Obs': 0})
+    df['short1_Obs'] = (df['lgth'] * df['short1_cov']).astype(int)
+    return df[['ID', 'lgth', 'out', 'in', 'long_cov', 'long_Obs',
+               'short1_cov', 'short1_Obs', 'short2_cov', 'short2_Obs']]
+
+
+def generate_dataset(out_dir, n_pairs, n_samples=2, read_len=100, genome_len=100000,
+                     error_rate=0.005, error_profile='ramp', n_contigs=100000, seed=1):
+    '''Write a complete synthetic dataset into out_dir: one interleaved
+    FASTQ per sample, split left/right FASTQs plus a resources.json
+    pointing at them for `pipeline`, a k-mer histogram and a velvet
+    stats file. Returns a dict of the generated paths.
+    '''
+    out_dir = os.path.abspath(out_dir)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    paths = {'samples': [], 'interleaved': []}
+    resources = {}
+    for s in range(n_samples):
+        sample = 'synthetic{s}'.format(s=s)
+        interleaved_fn = os.path.join(out_dir, sample + '.fq')
+        with open(interleaved_fn, 'w') as fp:
+            simulate_reads(fp, n_pairs, read_len=read_len, genome_len=genome_len,
+                           error_rate=error_rate, error_profile=error_profile,
+                           seed=seed + s, prefix=sample + ':')
+        paths['interleaved'].append(interleaved_fn)
+
+        # Split the interleaved file into the left/right layout that
+        # resources.json describes.
+        fns = [os.path.join(out_dir, '{sample}_R{r}.fq'.format(sample=sample, r=r)) for r in (1, 2)]
+        with open(interleaved_fn) as in_fp, open(fns[0], 'w') as left_fp, open(fns[1], 'w') as right_fp:
+            for n, line in enumerate(in_fp):
+                (left_fp if (n // 4) % 2 == 0 else right_fp).write(line)
+        for fragment, fn in zip(['left', 'right'], fns):
+            resources['{sample}_{fragment}'.format(**locals())] = {
+                'access': 'local_file',
+                'fragment': fragment,
+                'sample': sample,
+                'meta_type': 'sample',
+                'filename': os.path.basename(fn),
+                'url': 'file://' + fn}
+        paths['samples'].extend(fns)
+
+    adapters_fn = os.path.join(out_dir, 'adapters.fa.gz')
+    with gzip.open(adapters_fn, 'wb') as fp:
+        fp.write(b'>TruSeq_Adapter\nAGATCGGAAGAGCACACGTCTGAACTCCAGTCAC\n')
+    resources['adapters'] = {'meta_type': 'fasta_database',
+                             'filename': 'adapters.fa',
+                             'access': 'local_file',
+                             'url': 'file://' + adapters_fn}
+    paths['resources'] = os.path.join(out_dir, 'resources.json')
+    with open(paths['resources'], 'w') as fp:
+        json.dump(resources, fp, indent=4)
+
+    paths['hist'] = os.path.join(out_dir, 'synthetic.hist')
+    simulate_hist(seed=seed).to_csv(paths['hist'], index=False)
+
+    stats_dir = os.path.join(out_dir, 'synthetic-velvet')
+    if not os.path.exists(stats_dir):
+        os.makedirs(stats_dir)
+    paths['stats'] = os.path.join(stats_dir, 'stats.txt')
+    simulate_velvet_stats(n_contigs=n_contigs, seed=seed).to_csv(paths['stats'], sep='\t',
+                                                                 index=False)
+
+    return paths
+
+
+def replicate_resources(resources_fn, out_fn, n_samples):
+    '''Write a resources.json to out_fn with the samples of
+    resources_fn repeated under new names until there are n_samples,
+    all pointing at the same read files. Lets the task graph be sized
+    independently of how much data is generated.
+    '''
+    with open(resources_fn) as fp:
+        resources = json.load(fp)
+    samples = sorted(set(r['sample'] for r in resources.values() if r['meta_type'] == 'sample'))
+    replicated = dict((key, r) for key, r in resources.items() if r['meta_type'] != 'sample')
+    for s in range(n_samples):
+        source = samples[s % len(samples)]
+        sample = 'replicate{s}'.format(s=s)
+        for key, r in resources.items():
+            if r['meta_type'] == 'sample' and r['sample'] == source:
+                replicated['{sample}_{fragment}'.format(sample=sample, fragment=r['fragment'])] = \
+                    dict(r, sample=sample, filename=sample + '_' + r['filename'])
+    with open(out_fn, 'w') as fp:
+        json.dump(replicated, fp, indent=4)
+    return out_fn
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic reads, k-mer '
+                                     'histograms and assembly stats for benchmarking.')
+    parser.add_argument('-o', '--out-dir', default='_synthetic')
+    parser.add_argument('--n-pairs', type=int, default=100000)
+    parser.add_argument('--n-samples', type=int, default=2)
+    parser.add_argument('--read-len', type=int, default=100)
+    parser.add_argument('--genome-len', type=int, default=100000)
+    parser.add_argument('--error-rate', type=float, default=0.005)
+    parser.add_argument('--error-profile', choices=['flat', 'ramp'], default='ramp')
+    parser.add_argument('--n-contigs', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    paths = generate_dataset(args.out_dir, args.n_pairs, n_samples=args.n_samples,
+                             read_len=args.read_len, genome_len=args.genome_len,
+                             error_rate=args.error_rate, error_profile=args.error_profile,
+                             n_contigs=args.n_contigs, seed=args.seed)
+    print('** Wrote synthetic data to {d}'.format(d=os.path.abspath(args.out_dir)), file=sys.stderr)
+    return paths
+
+if __name__ == '__main__':
+    main()
@@ -5,18 +5,26 @@ from itertools import izip
 import json
 import os
 import pprint
+from Queue import Empty, Queue
 import re
 from shutil import rmtree
 import shutil
+import signal
+import subprocess
 import sys
+import threading
+import time
 
-from doit.tools import run_once, create_folder, title_with_actions
+from doit.exceptions import TaskError, TaskFailed
+from doit.tools import run_once, config_changed, create_folder, title_with_actions
 from doit.task import clean_targets, dict_to_task
 
 import jinja2
 import pandas as pd
 import screed
 
+import telemetry
+
 
 def clean_folder(target):
     try:
@@ -28,6 +36,143 @@ seq_ext = re.compile(r'(.fasta)|(.fa)|(.fastq)|(.fq)')
 def strip_seq_extension(fn):
     return seq_ext.split(fn)[0]
 
+def _stream_output(pipe, label, out):
+    for line in iter(pipe.readline, ''):
+        out.write('[{label}] {line}'.format(label=label, line=line))
+    pipe.close()
+
+def _kill_cmd(proc):
+    '''Terminate every process in proc's process group, not just its
+    shell, so the other stages of a pipeline don't linger.
+    '''
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except OSError:
+        pass
+
+def _wait_cmd(label, proc, readers, events, exited):
+    proc.wait()
+    exited.set()
+    if proc.returncode != 0:
+        # Stages still holding our pipes open would block the readers.
+        _kill_cmd(proc)
+    for reader in readers:
+        reader.join()
+    events.put((label, proc.returncode))
+
+def _watch_cmd(label, inputs, proc, exited, task):
+    '''Start reporting progress of proc through its input files.'''
+    progress = telemetry.Progress(task.name + ':' + label, inputs)
+    watcher = threading.Thread(target=telemetry.watch_process, args=(progress, proc, exited))
+    watcher.daemon = True
+    watcher.start()
+    return progress, watcher
+
+def run_cmd_graph(cmd_graph, inputs, task):
+    '''Run a list of (label, cmd, deps) shell commands, starting each
+    one as soon as every command labelled in its deps has finished, so
+    that independent commands within a task run concurrently. task is
+    filled in by doit.
+
+    stdout and stderr are streamed line by line, prefixed with the
+    command label. On the first failure the remaining commands are
+    terminated and a TaskFailed is returned; otherwise the wall time
+    of each command is returned, which doit stores as task values.
+    When `pipeline` has enabled telemetry, the progress of each
+    command through the files listed for its label in inputs is
+    written to the status directory.
+    '''
+    labels = [label for label, _, _ in cmd_graph]
+    if len(set(labels)) != len(labels):
+        return TaskError('duplicate command labels: {l}'.format(l=labels))
+    for label, _, deps in cmd_graph:
+        for dep in deps:
+            if dep not in labels:
+                return TaskError('{label} depends on unknown command {dep}'.format(**locals()))
+
+    pending = [(label, cmd, set(deps)) for label, cmd, deps in cmd_graph]
+    events = Queue()
+    running = {}
+    started = {}
+    progress = {}
+    timings = {}
+    failed = None
+
+    try:
+        while pending or running:
+            if failed is None:
+                for item in list(pending):
+                    label, cmd, deps = item
+                    if not deps.issubset(timings):
+                        continue
+                    pending.remove(item)
+                    print('-- [{label}] {cmd}'.format(**locals()), file=sys.stderr)
+                    # Each command gets its own process group so that it
+                    # can be killed along with everything its shell started.
+                    # Unlike a new session this keeps it in the batch
+                    # scheduler's job, so PBS can still clean it up.
+                    proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE, universal_newlines=True,
+                                            preexec_fn=os.setpgrp)
+                    readers = [threading.Thread(target=_stream_output, args=(proc.stdout, label, sys.stdout)),
+                               threading.Thread(target=_stream_output, args=(proc.stderr, label, sys.stderr))]
+                    for reader in readers:
+                        reader.daemon = True
+                        reader.start()
+                    exited = threading.Event()
+                    waiter = threading.Thread(target=_wait_cmd, args=(label, proc, readers, events, exited))
+                    waiter.daemon = True
+                    waiter.start()
+                    running[label] = proc
+                    started[label] = time.time()
+                    if telemetry.status_dir() is not None and inputs.get(label):
+                        progress[label] = _watch_cmd(label, inputs[label], proc, exited, task)
+            if not running:
+                if failed is None:
+                    failed = TaskError('dependency cycle among commands: {l}'.format(
+                                       l=[label for label, _, _ in pending]))
+                break
+
+            try:
+                # A timeout keeps the wait interruptible by Ctrl-C; a bare
+                # get() blocks signals until a command exits.
+                label, returncode = events.get(timeout=1)
+            except Empty:
+                continue
+            del running[label]
+            elapsed = time.time() - started[label]
+            print('-- [{label}] exited {returncode} after {elapsed:.1f}s'.format(**locals()), file=sys.stderr)
+            if label in progress:
+                # Let the watcher finish its last update so it can't
+                # overwrite the final status.
+                cmd_progress, watcher = progress[label]
+                watcher.join()
+                cmd_progress.write(done=returncode == 0)
+            if returncode == 0:
+                timings[label] = elapsed
+            elif failed is None:
+                failed = TaskFailed('command {label} exited with status {returncode}'.format(**locals()))
+                for proc in running.values():
+                    _kill_cmd(proc)
+    except BaseException:
+        # Interrupted (or crashed) while commands were still running:
+        # their process groups won't see a Ctrl-C, so take them down
+        # before letting the exception through.
+        for proc in running.values():
+            _kill_cmd(proc)
+        raise
+
+    if failed is not None:
+        return failed
+    return timings
+
+def monitored_cmd(cmd, inputs):
+    '''A doit action running a single shell command through
+    run_cmd_graph, so long-running stages report their progress
+    through the given input files.
+    '''
+    return (run_cmd_graph, [[('cmd', cmd, [])], {'cmd': inputs}])
+
 def create_task_object(task_dict_func):
     '''Wrapper to decorate functions returning pydoit
     Task dictionaries and have them return pydoit Task
@@ -80,32 +225,77 @@ def fastqc_task(sample_fn, fastqc_cfg):
             'uptodate': [run_once],
             'clean': [clean_targets]}
 
+_template_bytecode_cache = jinja2.FileSystemBytecodeCache()
+_template_envs = {}
+
+def get_template(template_fn):
+    '''Load template_fn through a jinja2 Environment shared by all the
+    templates in its directory, so each template is compiled once per
+    process and its bytecode is cached between runs.
+    '''
+    template_dir, name = os.path.split(os.path.abspath(template_fn))
+    try:
+        env = _template_envs[template_dir]
+    except KeyError:
+        env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dir),
+                                 bytecode_cache=_template_bytecode_cache)
+        _template_envs[template_dir] = env
+    return env.get_template(name)
+
+def write_if_changed(fn, content):
+    '''Write content to fn unless fn already holds exactly that, leaving
+    its timestamp alone. Returns whether the file was written.
+    '''
+    try:
+        with open(fn) as fp:
+            if fp.read() == content:
+                return False
+    except IOError:
+        pass
+    with open(fn, 'w') as fp:
+        fp.write(content)
+    return True
+
+def render_scripts(template_fn, scripts):
+    '''Render template_fn once for each (script_fn, context) pair,
+    only rewriting the scripts whose content changed.
+    '''
+    template = get_template(template_fn)
+    changed = [script_fn for script_fn, context in scripts \
+               if write_if_changed(script_fn, template.render(**context))]
+    return {'changed': ' '.join(changed)}
+
+def _render_scripts_task_dict(template_fn, scripts, file_dep, label):
+    return {'title': title_with_actions,
+            'name': label,
+            'actions': [(render_scripts, [template_fn, scripts])],
+            'file_dep': file_dep + [template_fn],
+            'targets': [script_fn for script_fn, _ in scripts],
+            # Re-render when a context changes, not just the template.
+            'uptodate': [config_changed(dict(scripts))],
+            'clean': [clean_targets]}
+
+@create_task_object
+def render_scripts_task(template_fn, scripts, file_dep, label):
+    '''Render a batch of scripts from one template, eg. for a parameter
+    sweep. scripts is a list of (script_fn, context) pairs; the contexts
+    are only read, never modified.
+    '''
+    return _render_scripts_task_dict(template_fn, scripts, file_dep, label)
+
 @create_task_object
 def build_velvet_task(file_list, template_fn, cur_time, velvet_cfg, pbs_cfg, label=''):
 
     if not label:
         label = 'velvet_' + '_'.join(file_list)
 
-    with open(template_fn) as fp:
-        template = jinja2.Template(fp.read())
-
     script_fn = cur_time + '-' + velvet_cfg['script_file']
-    velvet_cfg['directory'] = cur_time + '-' + velvet_cfg['directory']
-
-    velvet_cfg.update(pbs_cfg)
-    def create_script(file_list, velvet_cfg, tpl):
-        with open(script_fn, 'wb') as fp:
-            pbs = tpl.render(file_list=file_list, **velvet_cfg)
-            fp.write(pbs)
+    context = dict(velvet_cfg, file_list=file_list, **pbs_cfg)
+    context['directory'] = cur_time + '-' + velvet_cfg['directory']
 
     #cmd = 'qsub {fn}'.format(fn=script_fn)
 
-    return {'title': title_with_actions,
-            'name': label,
-            'actions': [(create_script, [file_list, velvet_cfg, template])],
-            'file_dep': file_list + [template_fn],
-            'targets': [script_fn],
-            'clean': [clean_targets]}
+    return _render_scripts_task_dict(template_fn, [(script_fn, context)], file_list, label)
 
 
 @create_task_object
@@ -114,79 +304,52 @@ def build_spades_task(file_list, template_fn, cur_time, spades_cfg, pbs_cfg, lab
     if not label:
         label = 'spades_' + '_'.join(file_list)
 
-    with open(template_fn) as fp:
-        template = jinja2.Template(fp.read())
-
     script_fn = cur_time + '-' + spades_cfg['script_file']
-    spades_cfg['directory'] = cur_time + '-' + spades_cfg['directory']
-
-    spades_cfg.update(pbs_cfg)
-    def create_script(file_list, spades_cfg, tpl):
-        with open(script_fn, 'wb') as fp:
-            pbs = tpl.render(file_list=file_list, **spades_cfg)
-            fp.write(pbs)
+    context = dict(spades_cfg, file_list=file_list, **pbs_cfg)
+    context['directory'] = cur_time + '-' + spades_cfg['directory']
 
     #cmd = 'qsub {fn}'.format(fn=script_fn)
 
-    return {'title': title_with_actions,
-            'name': label,
-            'actions': [(create_script, [file_list, spades_cfg, template])],
-            'file_dep': file_list + [template_fn],
-            'targets': [script_fn],
-            'clean': [clean_targets]}
+    return _render_scripts_task_dict(template_fn, [(script_fn, context)], file_list, label)
+
 
+def format_abyss(input_filename, output_filename):
+    with open(output_filename, 'wb') as fp:
+        for n, record in enumerate(screed.open(input_filename)):
+            if n % 2 == 0:
+                record.name = record.name + '/1'
+            else:
+                record.name = record.name + '/2'
+            fp.write('@{name}\n{seq}\n+\n{qual}\n'.format(name=record.name,
+                     seq=record.sequence, qual=record.quality))
 
 @create_task_object
 def format_abyss_task(input_filename, output_filename, label=''):
 
-    import screed
-
     if not label:
         label = 'format_abyss_' + input_filename
 
-    def format_abyss():
-        with open(output_filename, 'wb') as fp:
-            for n, record in enumerate(screed.open(input_filename)):
-                if n % 2 == 0:
-                    record.name = record.name + '/1'
-                else:
-                    record.name = record.name + '/2'
-                fp.write('@{name}\n{seq}\n+\n{qual}\n'.format(name=record.name,
-                         seq=record.sequence, qual=record.quality))
-    
     return {'title': title_with_actions,
             'name': label,
-            'actions': [(format_abyss, [])],
+            'actions': [(format_abyss, [input_filename, output_filename])],
             'file_dep': [input_filename],
             'targets': [output_filename],
             'clean': [clean_targets]}
 
 @create_task_object
-def build_abyss_task(file_list, abyss_cfg, pbs_cfg, label=''):
+def build_abyss_task(file_list, cur_time, abyss_cfg, pbs_cfg, label=''):
 
     if not label:
         label = 'abyss_' + '_'.join(file_list)
 
-    with open(abyss_cfg['template_file']) as fp:
-        template = jinja2.Template(fp.read())
-
-    abyss_cfg['name'] = CUR_TIME + '-' + abyss_cfg['name']
-    abyss_cfg.update(pbs_cfg)
-
-    script_fn = CUR_TIME + '-' + abyss_cfg['script_file']
-    def create_script(file_list, abyss_cfg, tpl):
-        with open(script_fn, 'wb') as fp:
-            pbs = tpl.render(files=' '.join(file_list), **abyss_cfg)
-            fp.write(pbs)
+    script_fn = cur_time + '-' + abyss_cfg['script_file']
+    context = dict(abyss_cfg, files=' '.join(file_list), **pbs_cfg)
+    context['name'] = cur_time + '-' + abyss_cfg['name']
 
     #cmd = 'qsub {fn}'.format(fn=script_fn)
 
-    return {'title': title_with_actions,
-            'name': label,
-            'actions': [(create_script, [file_list, abyss_cfg, template])],
-            'file_dep': file_list + [abyss_cfg['template_file']],
-            'targets': [script_fn],
-            'clean': [clean_targets]}
+    return _render_scripts_task_dict(abyss_cfg['template_file'], [(script_fn, context)],
+                                     file_list, label)
 
 
 
@@ -218,7 +381,7 @@ def diginorm_task(input_fn, output_fn, dg_cfg, load_ct=None, save_ct=None):
 
     return {'title': title_with_actions,
             'name': name,
-            'actions': [cmd],
+            'actions': [monitored_cmd(cmd, [input_fn])],
             'file_dep': file_dep,
             'targets': targets,
             'clean': [clean_targets]}
@@ -235,24 +398,30 @@ def chained_twopass_diginorm_task(input_files, dg_cfg, label, ct_outfn):
     inputs = ' '.join(input_files)
     suffix = '.C{c}'.format(c=coverage)
 
-    cmd_list = []
+    # Every pass loads and saves the same countgraph, so each command
+    # depends on the one before it.
+    cmd_graph = []
+    cmd_inputs = {}
     targets = []
     for n, fn in enumerate(input_files + [fn + suffix for fn in input_files]):
         out_fn = fn + suffix
         report_fn = out_fn + '.report.txt'
         cmd = 'normalize-by-median.py -f -k {ksize} -x {table_size} -N {n_tables} '\
               '-C {coverage} -R {report_fn} -o {out_fn} -s {ct_outfn} '.format(**locals())
+        deps = []
         if n > 0:
             cmd += '-l {ct_outfn} '.format(**locals())
+            deps.append(cmd_graph[-1][0])
         cmd += fn
-        cmd_list.append(cmd)
+        cmd_graph.append((out_fn, cmd, deps))
+        cmd_inputs[out_fn] = [fn]
 
         if n >= len(input_files):
             targets.append(out_fn)
 
     return {'title': title_with_actions,
             'name': name,
-            'actions': cmd_list,
+            'actions': [(run_cmd_graph, [cmd_graph, cmd_inputs])],
             'file_dep': input_files,
             'targets': targets,
             'clean': [clean_targets]}
@@ -272,7 +441,7 @@ def load_counting_task(file_list, table_fn, counting_cfg, label):
 
     return {'name': name,
             'title': title_with_actions,
-            'actions': [cmd],
+            'actions': [monitored_cmd(cmd, file_list)],
             'file_dep': file_list,
             'targets': [table_fn],
             'clean': [clean_targets]}
@@ -285,7 +454,7 @@ def abundance_dist_task(input_fn, table_fn, hist_fn):
 
     return {'name': name,
             'title': title_with_actions,
-            'actions': [cmd],
+            'actions': [monitored_cmd(cmd, [input_fn])],
             'file_dep': [input_fn, table_fn],
             'targets': [hist_fn],
             'clean': [clean_targets]}
@@ -321,12 +490,13 @@ def download_and_untar_task(url, target_dir, label=''):
 
     cmd1 = 'mkdir -p {target_dir}; curl {url} | tar -xz -C {target_dir}'.format(**locals())
     name = '_'.join(['download_untar', target_dir.strip('/'), label])
-    done = name + '.done'
-    cmd2 = 'touch {name}'.format(name=name)
+    done = '.'.join(filter(None, [target_dir.rstrip('/'), label, 'done']))
+    cmd2 = 'touch {done}'.format(done=done)
 
     return {'name': name,
             'title': title_with_actions,
-            'actions': [cmd1, cmd2],
+            'actions': [(run_cmd_graph, [[('untar', cmd1, []),
+                                          ('done', cmd2, ['untar'])], {}])],
             'targets': [done],
             'clean': [(clean_folder, [target_dir])],
             'uptodate': [run_once]}
@@ -390,7 +560,7 @@ def bowtie2_build_task(input_fn, db_basename, bowtie2_cfg):
 
     name = 'bowtie2_build_{db_basename}'.format(**locals())
     return {'title': title_with_actions,
-            'name': db_basename,
+            'name': name,
             'actions': [cmd, 'touch {db_basename}'.format(**locals())],
             'targets': targets,
             'file_dep': [input_fn],
@@ -398,8 +568,12 @@ def bowtie2_build_task(input_fn, db_basename, bowtie2_cfg):
 
 @create_task_object
 def bowtie2_align_task(db_basename, target_fn, bowtie2_cfg, left_fn='', right_fn='', singleton_fn='',
-                        read_fmt='-q', samtools_convert=True,
+                        interleaved_fn='', read_fmt='-q', samtools_convert=True,
                         encoding='phred33'):
+    '''Align reads against db_basename. With samtools_convert, the SAM
+    stream is piped straight into samtools sort, giving a sorted
+    target_fn.bam without an unsorted intermediate.
+    '''
 
     assert read_fmt in ['-q', '-f']
     assert encoding in ['phred33', 'phred64']
@@ -412,8 +586,10 @@ def bowtie2_align_task(db_basename, target_fn, bowtie2_cfg, left_fn='', right_fn
     
     file_dep = [db_basename]
     targets = []
+    read_fns = [fn for fn in [left_fn, right_fn, singleton_fn, interleaved_fn] if fn]
 
-    name = 'bowtie2_align' + ''.join('+' + fn if fn else fn for fn in [left_fn, right_fn, singleton_fn, db_basename])
+    name = 'bowtie2_align' + ''.join('+' + fn if fn else fn for fn in [left_fn, right_fn, singleton_fn,
+                                                                       interleaved_fn, db_basename])
 
     if left_fn:
         file_dep.extend([left_fn, right_fn])
@@ -422,21 +598,146 @@ def bowtie2_align_task(db_basename, target_fn, bowtie2_cfg, left_fn='', right_fn
     if singleton_fn:
         file_dep.append(singleton_fn)
         singleton_fn = '-U ' + singleton_fn
+    if interleaved_fn:
+        file_dep.append(interleaved_fn)
+        interleaved_fn = '--interleaved ' + interleaved_fn
     if samtools_convert:
-        targets.append(target_fn + '.bam')
-        target_fn = ' | samtools view -Sb - > {target_fn}.bam'.format(**locals())
+        bam_fn = target_fn + '.bam'
+        targets.append(bam_fn)
+        target_fn = ' | samtools sort -@ {n_threads} -T {bam_fn}.tmp -o {bam_fn} -'.format(**locals())
     else:
         targets.append(target_fn)
         target_fn = '-S ' + target_fn
 
-    cmd = cmd + '{left_fn} {right_fn} {singleton_fn} {target_fn}'.format(**locals())
+    cmd = cmd + '{left_fn} {right_fn} {singleton_fn} {interleaved_fn} {target_fn}'.format(**locals())
 
     return {'title': title_with_actions,
             'name': name,
-            'actions': [cmd],
+            'actions': [monitored_cmd(cmd, read_fns)],
             'targets': targets,
             'file_dep': file_dep,
             'clean': [clean_targets] }
+
+def split_reads(input_fn, shard_fns):
+    '''Deal the pairs of an interleaved read file round-robin into
+    shard_fns, keeping each pair together.
+    '''
+    fps = [open(fn, 'wb') for fn in shard_fns]
+    try:
+        for n, record in enumerate(screed.open(input_fn)):
+            fps[(n // 2) % len(fps)].write('@{name}\n{seq}\n+\n{qual}\n'.format(name=record.name,
+                                           seq=record.sequence, qual=record.quality))
+    finally:
+        for fp in fps:
+            fp.close()
+
+@create_task_object
+def split_reads_task(input_fn, n_shards, label):
+    '''Split input_fn into n_shards files named <label>.shard<n>; label
+    must be unique among the read files being split.
+    '''
+
+    shard_fns = ['{label}.shard{n}'.format(**locals()) for n in range(n_shards)]
+
+    return {'title': title_with_actions,
+            'name': 'split_reads_' + input_fn,
+            'actions': [(split_reads, [input_fn, shard_fns])],
+            'file_dep': [input_fn],
+            'targets': shard_fns,
+            'clean': [clean_targets]}
+
+@create_task_object
+def bowtie2_sharded_align_task(db_basename, shard_fns, bam_fn, bowtie2_cfg, encoding='phred33'):
+    '''Align interleaved read shards against db_basename concurrently,
+    each streaming straight into samtools sort, then merge the sorted
+    shards into an indexed bam_fn. n_threads is shared between the
+    concurrent shards, so the task uses about n_threads cores in all.
+    '''
+
+    assert encoding in ['phred33', 'phred64']
+    n_threads = bowtie2_cfg['n_threads']
+    shard_threads = max(1, n_threads // len(shard_fns))
+    extra_args = bowtie2_cfg['extra_args']
+
+    cmd_graph = []
+    cmd_inputs = {}
+    shard_bams = []
+    for n, shard_fn in enumerate(shard_fns):
+        label = 'align{n}'.format(n=n)
+        shard_bam = '{bam_fn}.shard{n}.bam'.format(**locals())
+        cmd = 'bowtie2 -p {shard_threads} {extra_args} --{encoding} -q -x {db_basename} '\
+              '--interleaved {shard_fn} | samtools sort -@ {shard_threads} -T {shard_bam}.tmp '\
+              '-o {shard_bam} -'.format(**locals())
+        cmd_graph.append((label, cmd, []))
+        cmd_inputs[label] = [shard_fn]
+        shard_bams.append(shard_bam)
+
+    shards = ' '.join(shard_bams)
+    cmd_graph.append(('merge', 'samtools merge -f -@ {n_threads} {bam_fn} {shards} && '\
+                               'rm -f {shards}'.format(**locals()),
+                      [label for label, _, _ in cmd_graph]))
+    cmd_graph.append(('index', 'samtools index {bam_fn}'.format(**locals()), ['merge']))
+
+    return {'title': title_with_actions,
+            'name': 'bowtie2_sharded_align_' + bam_fn,
+            'actions': [(run_cmd_graph, [cmd_graph, cmd_inputs])],
+            'file_dep': [db_basename] + shard_fns,
+            'targets': [bam_fn, bam_fn + '.bai'],
+            'clean': [clean_targets, 'rm -f {shards}'.format(**locals())]}
+
+def contig_coverage(bam_fn, chunksize=1000000):
+    '''Per-contig length, mean depth and fraction of bases covered,
+    computed from `samtools depth` in chunked, vectorized passes. -aa
+    reports contigs with no reads at all, and -d 0 lifts the depth cap
+    of older samtools.
+    '''
+    proc = subprocess.Popen(['samtools', 'depth', '-aa', '-d', '0', bam_fn], stdout=subprocess.PIPE)
+    partials = []
+    for chunk in pd.read_csv(proc.stdout, delimiter='\t', header=None, usecols=[0, 2],
+                             names=['contig', 'pos', 'depth'], dtype={'contig': str},
+                             chunksize=chunksize):
+        chunk['covered'] = chunk['depth'] > 0
+        partials.append(chunk.groupby('contig').agg({'depth': ['sum', 'count'],
+                                                     'covered': 'sum'}))
+    if proc.wait() != 0:
+        raise RuntimeError('samtools depth failed on {fn}'.format(fn=bam_fn))
+
+    # Contigs can straddle chunk boundaries, so sum the partial counts.
+    totals = pd.concat(partials).groupby(level=0).sum()
+    df = pd.DataFrame({'lgth': totals['depth']['count'],
+                       'mean_cov': totals['depth']['sum'] / totals['depth']['count'],
+                       'frac_covered': totals['covered']['sum'] / totals['depth']['count']})
+    df.index.name = 'contig'
+    return df
+
+@create_task_object
+def contig_coverage_task(bam_fn, output_fn):
+
+    def compute_coverage():
+        contig_coverage(bam_fn).to_csv(output_fn, sep='\t')
+
+    return {'title': title_with_actions,
+            'name': 'contig_coverage_' + output_fn,
+            'actions': [(compute_coverage, [])],
+            'file_dep': [bam_fn, bam_fn + '.bai'],
+            'targets': [output_fn],
+            'clean': [clean_targets]}
+
+@create_task_object
+def plot_coverage_task(coverage_fn, output_prefix, fmt='pdf'):
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plot_stats.py')
+    cmd = 'python {script} --coverage-file {coverage_fn} -o {output_prefix} '\
+          '--format {fmt}'.format(**locals())
+
+    return {'title': title_with_actions,
+            'name': 'plot_coverage_' + output_prefix,
+            'actions': [cmd],
+            'file_dep': [coverage_fn, script],
+            'targets': ['{p}.{s}.{fmt}'.format(p=output_prefix, s=s, fmt=fmt) \
+                        for s in ['aln_cov', 'aln_cov_lgth']],
+            'clean': [clean_targets]}
+
 @create_task_object
 def trimmomatic_pe_task(left_in, right_in, left_paired_out, left_unpaired_out, 
                      right_paired_out, right_unpaired_out, adapter_fn, encoding, trim_cfg):
@@ -451,7 +752,7 @@ def trimmomatic_pe_task(left_in, right_in, left_paired_out, left_unpaired_out,
 
     return {'title': title_with_actions,
             'name': name,
-            'actions': [cmd],
+            'actions': [monitored_cmd(cmd, [left_in, right_in])],
             'file_dep': [left_in, right_in, adapter_fn],
             'targets': [left_paired_out, left_unpaired_out, right_paired_out, right_unpaired_out],
             'clean': [clean_targets]}
@@ -468,7 +769,7 @@ def trimmomatic_se_task(sample_fn, output_fn, adapter_fn, encoding, trim_cfg):
 
     return {'title': title_with_actions,
             'name': name,
-            'actions': [cmd],
+            'actions': [monitored_cmd(cmd, [sample_fn])],
             'file_dep': [sample_fn, adapter_fn],
             'targets': [output_fn],
             'clean': [clean_targets]}
@@ -483,7 +784,7 @@ def interleave_task(left_in, right_in, out_fn, label=''):
 
     return {'title': title_with_actions,
             'name': label,
-            'actions': [cmd],
+            'actions': [monitored_cmd(cmd, [left_in, right_in])],
             'file_dep': [left_in, right_in],
             'targets': [out_fn],
             'clean': [clean_targets]}
@@ -508,9 +809,13 @@ def group_task(group_name, task_names):
 
 # python3 BUSCO_v1.1b1/BUSCO_v1.1b1.py -in petMar2.cdna.fa -o petMar2.cdna.busco.test -l vertebrata/ -m trans -c 4
 @create_task_object
-def busco_task(input_filename, output_dir, busco_db_dir, input_type, busco_cfg):
+def busco_task(input_filename, output_dir, busco_db_dir, input_type, busco_cfg, db_done=None):
+    '''Run BUSCO on input_filename against the lineage in busco_db_dir.
+    When the lineage comes from download_and_untar_task, pass its target
+    as db_done so the run waits on (and is invalidated by) the download.
+    '''
     
-    name = '_'.join(['busco', input_filename, os.path.basename(busco_db_dir)])
+    name = '_'.join(['busco', input_filename, os.path.basename(busco_db_dir.rstrip('/'))])
 
     assert input_type in ['genome', 'OGS', 'trans']
     n_threads = busco_cfg['n_threads']
@@ -521,26 +826,81 @@ def busco_task(input_filename, output_dir, busco_db_dir, input_type, busco_cfg):
             in_fn=input_filename, out_dir=output_dir, db_dir=busco_db_dir, 
             in_type=input_type, n_threads=n_threads)
 
+    file_dep = [input_filename]
+    if db_done is not None:
+        file_dep.append(db_done)
+
     return {'name': name,
             'title': title_with_actions,
             'actions': [cmd],
-            'targets': ['run_' + output_dir, 
-                        os.path.join('run_' + output_dir, 'short_summary_' + output_dir.rstrip('/'))],
-            'file_dep': [input_filename],
-            'uptodate': [run_once],
+            'targets': ['run_' + output_dir, busco_summary_fn(output_dir)],
+            'file_dep': file_dep,
             'clean': [(clean_folder, ['run_' + output_dir])]}
 
+def busco_summary_fn(output_dir):
+    output_dir = output_dir.rstrip('/')
+    return os.path.join('run_' + output_dir, 'short_summary_' + output_dir)
+
 @create_task_object
-def quast_task(assemblies, quast_cfg, label):
+def quast_task(assemblies, quast_cfg, label, output_dir='quast_results'):
 
-    cmd = 'python {path}/quast.py {params} -L -m {min_length} -t {n_threads} -e --no-snps {files}'.format(
-               files=' '.join(assemblies), **quast_cfg)
+    cmd = 'python {path}/quast.py {params} -L -m {min_length} -t {n_threads} -e --no-snps '\
+          '-o {output_dir} {files}'.format(files=' '.join(assemblies), output_dir=output_dir,
+                                           **quast_cfg)
 
     return {'name': 'quast_' + label,
             'title': title_with_actions,
             'actions': [cmd],
-            'targets': ['quast_results', 'quast_results/latest'],
+            'targets': [output_dir, os.path.join(output_dir, 'report.tsv')],
             'file_dep': assemblies,
-            'uptodate': [run_once],
-            'clean': [(clean_folder, ['quast_results'])]}
+            'clean': [(clean_folder, [output_dir])]}
+
+busco_summary_re = re.compile(r'C:(?P<complete>[\d.]+)%\[D:(?P<duplicated>[\d.]+)%\],'
+                              r'F:(?P<fragmented>[\d.]+)%,M:(?P<missing>[\d.]+)%,n:(?P<n>\d+)')
+def parse_busco_summary(summary_fn):
+    '''Pull the C/D/F/M percentages and lineage size out of a BUSCO
+    short summary.
+    '''
+    with open(summary_fn) as fp:
+        for line in fp:
+            match = busco_summary_re.search(line)
+            if match:
+                return pd.Series({'BUSCO ' + key: float(val) \
+                                  for key, val in match.groupdict().items()})
+    raise ValueError('No BUSCO summary line found in {fn}'.format(fn=summary_fn))
+
+def parse_quast_report(report_fn):
+    '''Read a single-assembly QUAST report.tsv into a Series of metrics.
+    '''
+    df = pd.read_csv(report_fn, delimiter='\t', index_col=0)
+    return df.iloc[:,0]
+
+@create_task_object
+def assessment_summary_task(labels, quast_reports, busco_summaries, output_fn):
+    '''Collect the per-assembly QUAST and BUSCO results into one table,
+    one row per assembly. busco_summaries holds a list of (lineage,
+    summary_fn) pairs for each assembly; their columns are prefixed
+    with the lineage.
+    '''
+
+    def summarize():
+        rows = []
+        for quast_fn, lineage_summaries in izip(quast_reports, busco_summaries):
+            row = [parse_quast_report(quast_fn)]
+            for lineage, busco_fn in lineage_summaries:
+                busco = parse_busco_summary(busco_fn)
+                busco.index = [lineage + ' ' + key for key in busco.index]
+                row.append(busco)
+            rows.append(pd.concat(row))
+        df = pd.DataFrame(rows, index=labels)
+        df.index.name = 'assembly'
+        df.to_csv(output_fn, sep='\t')
+
+    return {'name': 'assessment_summary_' + output_fn,
+            'title': title_with_actions,
+            'actions': [(summarize, [])],
+            'file_dep': quast_reports + [fn for lineage_summaries in busco_summaries \
+                                         for _, fn in lineage_summaries],
+            'targets': [output_fn],
+            'clean': [clean_targets]}
 
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import glob
+import json
+import os
+import threading
+import time
+
+STATUS_DIR_VAR = 'PIPELINE_STATUS_DIR'
+
+
+def status_dir():
+    '''Directory that running tasks write their status files to, as
+    exported by `pipeline`; None when telemetry is off.
+    '''
+    return os.environ.get(STATUS_DIR_VAR)
+
+
+def process_tree(pid):
+    '''pid and all of its live descendants, found by walking the ppid
+    field of every /proc/<pid>/stat.
+    '''
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/{p}/stat'.format(p=entry)) as fp:
+                stat = fp.read()
+        except IOError:
+            continue
+        # The command name may contain spaces, so split after its ')'.
+        ppid = int(stat.rsplit(')', 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+
+    tree, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        tree.append(p)
+        stack.extend(children.get(p, []))
+    return tree
+
+
+def read_proc_io(pid):
+    '''Total bytes read (rchar) by pid, from /proc/<pid>/io.'''
+    with open('/proc/{p}/io'.format(p=pid)) as fp:
+        for line in fp:
+            if line.startswith('rchar:'):
+                return int(line.split()[1])
+    return 0
+
+
+def read_proc_rss(pid):
+    '''Resident memory of pid in kB, from /proc/<pid>/status.'''
+    with open('/proc/{p}/status'.format(p=pid)) as fp:
+        for line in fp:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def read_fd_offsets(pid, paths):
+    '''Current file offset of each of paths that pid has open.'''
+    offsets = {}
+    fd_dir = '/proc/{p}/fd'.format(p=pid)
+    for fd in os.listdir(fd_dir):
+        try:
+            target = os.readlink(os.path.join(fd_dir, fd))
+        except OSError:
+            continue
+        if target in paths:
+            with open('/proc/{p}/fdinfo/{fd}'.format(p=pid, fd=fd)) as fp:
+                for line in fp:
+                    if line.startswith('pos:'):
+                        offsets[target] = max(offsets.get(target, 0), int(line.split()[1]))
+    return offsets
+
+
+class Progress(object):
+    '''Tracks how far a task has got through its input files.
+
+    Bytes consumed are taken from the file offsets that the watched
+    processes hold on the inputs, so it works the same for external
+    commands and for Python loops (which watch their own pid). Loops
+    can also report a record count for a reads/sec figure. Status is
+    written as JSON to <status dir>/<label>.json at most every
+    `interval` seconds; without a status dir nothing is written.
+    '''
+
+    def __init__(self, label, input_files, pids=None, interval=10.0):
+        self.label = label
+        self.inputs = set(os.path.realpath(fn) for fn in input_files)
+        self.total_bytes = sum(os.path.getsize(fn) for fn in self.inputs if os.path.exists(fn))
+        self.pids = pids
+        self.interval = interval
+        self.start = time.time()
+        self.last_write = 0
+        self.records = None
+
+        self._offsets = {}
+        self._rchar = {}
+        self._rss = 0
+
+        out_dir = status_dir()
+        self.status_fn = None
+        if out_dir is not None:
+            self.status_fn = os.path.join(out_dir, label.replace('/', '_') + '.json')
+
+    def _poll(self):
+        pids = self.pids() if callable(self.pids) else (self.pids or [os.getpid()])
+        rss = 0
+        for pid in pids:
+            # Processes can exit between listing and reading; keep the
+            # last values we saw for them.
+            try:
+                for fn, pos in read_fd_offsets(pid, self.inputs).items():
+                    self._offsets[fn] = max(self._offsets.get(fn, 0), pos)
+                self._rchar[pid] = read_proc_io(pid)
+                rss += read_proc_rss(pid)
+            except (IOError, OSError):
+                continue
+        self._rss = rss
+
+    def status(self, done=False):
+        elapsed = time.time() - self.start
+        consumed = self.total_bytes if done else sum(self._offsets.values())
+        byte_rate = consumed / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if byte_rate > 0 and not done:
+            eta = max(self.total_bytes - consumed, 0) / byte_rate
+        status = {'task': self.label,
+                  'done': done,
+                  'elapsed': elapsed,
+                  'bytes_consumed': consumed,
+                  'total_bytes': self.total_bytes,
+                  'fraction': float(consumed) / self.total_bytes if self.total_bytes else None,
+                  'bytes_per_sec': byte_rate,
+                  'io_read_bytes': sum(self._rchar.values()),
+                  'eta': eta,
+                  'rss_mb': self._rss / 1024.0,
+                  'updated': time.time()}
+        if self.records is not None:
+            status['records'] = self.records
+            status['records_per_sec'] = self.records / elapsed if elapsed > 0 else 0.0
+        return status
+
+    def write(self, done=False):
+        if self.status_fn is None:
+            return
+        tmp_fn = self.status_fn + '.tmp'
+        with open(tmp_fn, 'w') as fp:
+            json.dump(self.status(done=done), fp)
+        os.rename(tmp_fn, self.status_fn)
+
+    def update(self, records=None):
+        '''Record progress; cheap enough to call from a per-record loop,
+        since /proc is only read every `interval` seconds.
+        '''
+        if records is not None:
+            self.records = records
+        now = time.time()
+        if now - self.last_write >= self.interval:
+            self.last_write = now
+            self._poll()
+            self.write()
+            return True
+        return False
+
+    def finish(self):
+        self._poll()
+        self.write(done=True)
+
+    def summary(self):
+        status = self.status()
+        msg = '{:.1%} of input'.format(status['fraction'] or 0)
+        if 'records_per_sec' in status:
+            msg += ', {:.0f} reads/sec'.format(status['records_per_sec'])
+        if status['eta'] is not None:
+            msg += ', ETA {:.0f}s'.format(status['eta'])
+        return msg + ', {:.0f} MB RSS'.format(status['rss_mb'])
+
+
+def watch_process(progress, proc, exited):
+    '''Update progress for the process tree rooted at proc until the
+    exited event is set. Meant to run in a daemon thread; it never
+    polls proc, so that whoever waits on proc gets its exit status.
+    '''
+    progress.pids = lambda: process_tree(proc.pid)
+    while not exited.is_set():
+        progress.update()
+        exited.wait(1)
+
+
+def read_status(out_dir):
+    statuses = {}
+    for fn in glob.glob(os.path.join(out_dir, '*.json')):
+        try:
+            with open(fn) as fp:
+                status = json.load(fp)
+        except (IOError, ValueError):
+            continue
+        statuses[status['task']] = status
+    return statuses
+
+
+def serve_status(out_dir, port):
+    '''Serve the status of every task in out_dir as JSON on
+    http://localhost:<port>/ from a daemon thread.
+    '''
+
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(read_status(out_dir), indent=2, sort_keys=True)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('localhost', port), StatusHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+'''Run tasks built on run_cmd_graph through doit itself, offline, to
+check that doit accepts and executes their actions. Exits non-zero on
+the first problem.
+'''
+from __future__ import print_function
+
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+SCRIPT = os.path.abspath(__file__)
+sys.path.insert(0, os.path.dirname(os.path.dirname(SCRIPT)))
+
+from doit.cmd_base import TaskLoader
+from doit.doit_cmd import DoitMain
+from doit.task import dict_to_task
+from doit.tools import title_with_actions
+
+from tasks import download_and_untar_task, monitored_cmd
+import telemetry
+
+
+def run_tasks(tasks):
+    class Loader(TaskLoader):
+        @staticmethod
+        def load_tasks(cmd, opt_values, pos_args):
+            return tasks, {'verbosity': 2}
+
+    return DoitMain(Loader()).run(['run'])
+
+
+def run_sleeper():
+    '''Run a long command through doit, for check_interrupt to stop.'''
+    sleep = dict_to_task({'name': 'sleep',
+                          'actions': [monitored_cmd('echo $$ > sleep.pid; sleep 30; touch finished',
+                                                    ['reads.fq'])]})
+    sys.exit(run_tasks([sleep]))
+
+
+def check_interrupt():
+    '''Ctrl-C in the middle of a command must stop doit promptly and
+    take the command down with it.
+    '''
+    with open(os.devnull, 'w') as devnull:
+        # The child's KeyboardInterrupt traceback is expected noise.
+        child = subprocess.Popen([sys.executable, SCRIPT, '--sleeper'],
+                                 stdout=devnull, stderr=devnull)
+    deadline = time.time() + 10
+    while not os.path.exists('sleep.pid') and time.time() < deadline:
+        time.sleep(0.1)
+    assert os.path.exists('sleep.pid'), 'the command never started'
+    time.sleep(0.5)
+    child.send_signal(signal.SIGINT)
+    deadline = time.time() + 5
+    while child.poll() is None and time.time() < deadline:
+        time.sleep(0.1)
+    if child.poll() is None:
+        child.kill()
+        raise AssertionError('doit kept running after SIGINT')
+
+    cmd_pid = int(open('sleep.pid').read())
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        try:
+            os.killpg(cmd_pid, 0)
+        except OSError:
+            break
+        time.sleep(0.1)
+    else:
+        os.killpg(cmd_pid, signal.SIGKILL)
+        raise AssertionError('the command outlived the interrupted doit run')
+    assert not os.path.exists('finished')
+
+
+def main():
+    work_dir = tempfile.mkdtemp(prefix='check-actions-')
+    old_dir = os.getcwd()
+    try:
+        os.chdir(work_dir)
+        status_dir = os.path.join(work_dir, 'status')
+        os.makedirs(status_dir)
+        os.environ[telemetry.STATUS_DIR_VAR] = status_dir
+
+        with open('reads.fq', 'w') as fp:
+            fp.write('@r/1\nACGT\n+\nIIII\n' * 1000)
+        with tarfile.open('db.tar.gz', 'w:gz') as tar:
+            tar.add('reads.fq', arcname='lineage/reads.fq')
+
+        untar = download_and_untar_task('file://' + os.path.abspath('db.tar.gz'),
+                                        'db', label='lineage')
+        copy = dict_to_task({'name': 'copy_reads',
+                             'title': title_with_actions,
+                             'actions': [monitored_cmd('cat reads.fq > copy.fq', ['reads.fq'])],
+                             'file_dep': ['reads.fq'],
+                             'targets': ['copy.fq']})
+        assert run_tasks([untar, copy]) == 0, 'doit failed to run the tasks'
+        assert os.path.exists(os.path.join('db', 'lineage', 'reads.fq'))
+        assert os.path.exists(untar.targets[0])
+        assert open('copy.fq').read() == open('reads.fq').read()
+
+        status = telemetry.read_status(status_dir)['copy_reads:cmd']
+        assert status['done'] and status['fraction'] == 1.0, status
+
+        fail = dict_to_task({'name': 'fail',
+                             'actions': [monitored_cmd('exit 3', ['reads.fq'])]})
+        assert run_tasks([fail]) != 0, 'a failing command was reported as success'
+
+        check_interrupt()
+    finally:
+        os.chdir(old_dir)
+        shutil.rmtree(work_dir)
+
+    print('** All actions ran through doit as expected', file=sys.stderr)
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--sleeper']:
+        run_sleeper()
+    main()